@@ -0,0 +1,47 @@
+"""
+Numba kernel for the pairwise nominal alpha sums (used by analyze_h2h.pairwise_alpha_nominal).
+
+One compiled pass over the rating matrix, parallel over blocks of items, with no
+(items x raters x cats) one-hot temporary. Importing this module raises
+ImportError when numba is not installed; callers fall back to the NumPy path.
+"""
+import numpy as np
+from numba import njit, prange, get_num_threads
+
+def pair_sums(X, cats):
+    """
+    X: float64[:, :] (NaN = missing), cats: sorted float64[:] of the values present.
+    Returns (n, agree, share) as in pairwise_alpha_nominal: n[a, b] items both
+    raters labeled, agree[a, b] items they labeled the same, share[c, a, b] items
+    where a said c and b also rated.
+    """
+    return _pair_sums(X, cats, max(1, min(X.shape[0], 4 * get_num_threads())))
+
+@njit(parallel=True, cache=True)
+def _pair_sums(X, cats, n_blocks):
+    n_items, n_raters = X.shape
+    n_cats = cats.shape[0]
+    n = np.zeros((n_blocks, n_raters, n_raters))
+    agree = np.zeros((n_blocks, n_raters, n_raters))
+    share = np.zeros((n_blocks, n_cats, n_raters, n_raters))
+    for blk in prange(n_blocks):
+        lo = blk * n_items // n_blocks
+        hi = (blk + 1) * n_items // n_blocks
+        code = np.empty(n_raters, dtype=np.int64)
+        for i in range(lo, hi):
+            for r in range(n_raters):
+                x = X[i, r]
+                code[r] = -1 if np.isnan(x) else np.searchsorted(cats, x)
+            for a in range(n_raters):
+                ca = code[a]
+                if ca < 0:
+                    continue
+                for b in range(n_raters):
+                    cb = code[b]
+                    if cb < 0:
+                        continue
+                    n[blk, a, b] += 1.0
+                    share[blk, ca, a, b] += 1.0
+                    if ca == cb:
+                        agree[blk, a, b] += 1.0
+    return n.sum(axis=0), agree.sum(axis=0), share.sum(axis=0)
@@ -0,0 +1,48 @@
+"""
+Columnar copies of overall.csv for the scripts that read it.
+
+Run once (and again whenever the CSV changes):
+  python scripts/_cache_overall.py
+This writes "annotated data sets/overall.parquet" next to the CSV.
+make_sentences_only.py and score_llm_vs_gold.py read the Parquet file instead
+of re-parsing the CSV whenever it is at least as new as the CSV.
+"""
+import argparse, importlib.util, os
+
+def parquet_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+def fresh_parquet(csv_path, columns=None):
+    """
+    Path of csv_path's Parquet copy if it exists, is not older than the CSV and
+    its footer reads with all of `columns` present; else None (callers use the CSV).
+    """
+    pq = parquet_path(csv_path)
+    if importlib.util.find_spec("pyarrow") is None:
+        return None
+    if not os.path.exists(pq) or (os.path.exists(csv_path) and os.path.getmtime(pq) < os.path.getmtime(csv_path)):
+        return None
+    import pyarrow.parquet
+    try:  # truncated or half-written file: ArrowInvalid (a ValueError) or OSError
+        names = pyarrow.parquet.read_schema(pq).names
+    except (OSError, ValueError):
+        return None
+    return pq if set(columns or ()) <= set(names) else None
+
+def build_parser(prog=None):
+    ap = argparse.ArgumentParser(prog=prog, description="Convert overall.csv to Parquet")
+    ap.add_argument("--src", default=r"annotated data sets\overall.csv")
+    return ap
+
+def run(args):
+    import pandas as pd
+    df = pd.read_csv(args.src, dtype={"Sentence": "string"})
+    pq = parquet_path(args.src)
+    df.to_parquet(pq, index=False)
+    print(f"Wrote {pq} with", len(df), "rows")
+
+def main(argv=None):
+    run(build_parser().parse_args(argv))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Input de-duplication for the LLM labeling scripts.
+
+Requirements corpora repeat boilerplate sentences; each distinct text only
+needs to reach the model once. Rows flow through filter() on the way in and
+results through done() on the way out, and every repeat of a text gets the
+result of its first occurrence.
+"""
+
+class Dedup:
+    def __init__(self, emit):
+        self.emit = emit      # emit((row, text), result), called once per input row
+        self.results = {}     # text -> result, once its first occurrence is labeled
+        self.waiting = {}     # text -> rows repeating it while the first is in flight
+        self.avoided = 0
+
+    def filter(self, chunks):
+        """Yields each chunk of (row, text) with already-seen texts taken out."""
+        for rows in chunks:
+            fresh = []
+            for i, t in rows:
+                if t in self.results:
+                    self.avoided += 1
+                    self.emit((i, t), self.results[t])
+                elif t in self.waiting:
+                    self.avoided += 1
+                    self.waiting[t].append(i)
+                else:
+                    self.waiting[t] = []
+                    fresh.append((i, t))
+            yield fresh
+
+    def done(self, row, res):
+        """Result for a first occurrence: emit it and every repeat queued behind it."""
+        i, t = row
+        self.results[t] = res
+        self.emit(row, res)
+        for j in self.waiting.pop(t, ()):
+            self.emit((j, t), res)
@@ -0,0 +1,35 @@
+"""
+On-disk cache of LLM labels, shared by the LLM labeling scripts.
+
+Calls are (near-)deterministic and the answers are tiny JSON objects, so we
+key them by a hash of everything that goes into the request and store them in
+a SQLite file. Reruns over overlapping inputs then cost no API calls.
+"""
+import os, sqlite3, hashlib, orjson
+
+DEFAULT_PATH = os.path.join("outputs", ".llm_cache.sqlite")
+
+def make_key(model, prompt, text, temperature):
+    """`prompt`: every fixed part of the request (system prompt + user template), so editing either misses the cache."""
+    h = hashlib.sha256()
+    for part in (model, prompt, text, temperature):
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+class LLMCache:
+    def __init__(self, path=DEFAULT_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None)  # autocommit: every set() is durable
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS labels (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def get(self, key):
+        row = self.conn.execute("SELECT value FROM labels WHERE key = ?", (key,)).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def set(self, key, val):
+        self.conn.execute("INSERT OR REPLACE INTO labels (key, value) VALUES (?, ?)", (key, orjson.dumps(val).decode()))
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,76 @@
+"""
+Token-bucket limiter shared by the LLM labeling scripts.
+
+Paces requests so we stay under a requests-per-minute (RPM) and estimated
+tokens-per-minute (TPM) budget instead of bouncing off 429s. Same scheme as
+the openai-cookbook api_request_parallel_processor.py: both capacities refill
+continuously at rpm/60 and tpm/60 per second, and a request only fires once
+both cover it. rpm/tpm of 0 disables that limit.
+"""
+import time, asyncio
+
+def estimate_tokens(text):
+    """Rough prompt+completion token estimate (~4 chars per token, +200 for the reply/overhead)."""
+    return len(text) // 4 + 200
+
+def parse_retry_after(headers, default):
+    """Seconds to back off as told by a 429 response (retry-after-ms / Retry-After), else `default`."""
+    try:
+        ms = headers.get("retry-after-ms")
+        if ms is not None:
+            return max(0.0, float(ms) / 1000.0)
+        s = headers.get("Retry-After")
+        if s is not None:
+            return max(0.0, float(s))
+    except (TypeError, ValueError):
+        pass
+    return default
+
+class TokenBucket:
+    def __init__(self, rpm=0, tpm=0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.available_request_capacity = float(rpm)
+        self.available_token_capacity = float(tpm)
+        self.last_update = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self.last_update
+        if elapsed <= 0:
+            return
+        if self.rpm:
+            self.available_request_capacity = min(self.rpm, self.available_request_capacity + self.rpm * elapsed / 60.0)
+        if self.tpm:
+            self.available_token_capacity = min(self.tpm, self.available_token_capacity + self.tpm * elapsed / 60.0)
+        self.last_update = now
+
+    def _take(self, tokens):
+        """Consume capacity for one request and return 0, or return how long to wait first."""
+        now = time.monotonic()
+        if now < self.last_update:  # still drained after a 429
+            return self.last_update - now
+        self._refill(now)
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        wait = 0.0
+        if self.rpm and self.available_request_capacity < 1:
+            wait = max(wait, (1 - self.available_request_capacity) * 60.0 / self.rpm)
+        if self.tpm and self.available_token_capacity < tokens:
+            wait = max(wait, (tokens - self.available_token_capacity) * 60.0 / self.tpm)
+        if wait > 0:
+            return wait
+        if self.rpm:
+            self.available_request_capacity -= 1
+        if self.tpm:
+            self.available_token_capacity -= tokens
+        return 0.0
+
+    async def wait(self, tokens):
+        """Wait until a request of ~`tokens` tokens may fire. _take() never awaits, so no lock is needed."""
+        while (wait := self._take(tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def drain(self, seconds):
+        """Empty the bucket and hold every caller for `seconds` (used on HTTP 429)."""
+        self.available_request_capacity = 0.0
+        self.available_token_capacity = 0.0
+        self.last_update = max(self.last_update, time.monotonic() + seconds)
@@ -1,50 +1,95 @@
-import pandas as pd, numpy as np
+import argparse, pandas as pd, numpy as np
 from itertools import combinations
 
+def category_counts(X, mask, cats, max_cells=1 << 24):
+    """(n_items, n_cats) matrix: how many raters put item i in category c.
+    Built in row blocks so the (rows, raters, cats) temporary stays under max_cells."""
+    counts = np.empty((X.shape[0], len(cats)), dtype=np.int64)
+    step = max(1, max_cells // max(1, X.shape[1] * len(cats)))
+    for s in range(0, X.shape[0], step):
+        blk = slice(s, s + step)
+        counts[blk] = ((X[blk, :, None] == cats[None, None, :]) & mask[blk, :, None]).sum(axis=1)
+    return counts
+
 def kripp_alpha_nominal(X):
     X = np.asarray(X, dtype=float)
     mask = ~np.isnan(X)
     cats = np.unique(X[mask])
-    # observed disagreement
-    Do_num=0.0; Do_den=0.0
-    for i in range(X.shape[0]):
-        vals = X[i, mask[i]]
-        m = len(vals)
-        if m<=1: continue
-        Do_den += m*(m-1)
-        for c in cats:
-            n = np.sum(vals==c)
-            Do_num += n*(m-n)
+    counts = category_counts(X, mask, cats)
+    # observed disagreement (items with m<=1 contribute 0 to both sums)
+    m = counts.sum(axis=1)
+    Do_num = float((counts * (m[:, None] - counts)).sum())
+    Do_den = float((m * (m - 1)).sum())
     Do = Do_num/Do_den if Do_den>0 else np.nan
     # expected disagreement
-    n_tot = np.sum(mask)
+    n_tot = m.sum()
     if n_tot==0: return np.nan
-    p = [np.sum((X==c)&mask)/n_tot for c in cats]
+    p = counts.sum(axis=0) / n_tot
     De = 1.0 - np.sum(np.square(p))
     if De==0: return 1.0 if Do==0 else np.nan
     return 1.0 - Do/De
 
-def main():
-    path = r"annotated data sets\annotation_causal.csv"
-    df = pd.read_csv(path)
+def pairwise_alpha_nominal(X):
+    """
+    Nominal alpha for every pair of columns (raters) of X, each computed over the
+    items both raters labeled -- same result as kripp_alpha_nominal(X[both][:, [a, b]]).
+    With exactly 2 values per item, Do = 1 - agreements/n and p_c is the pair's
+    share of category c, so all pairs fall out of a few tensor contractions over a
+    one-hot (items, raters, cats) tensor built once. With numba installed the
+    same sums come from one compiled pass (_alpha_numba) without that tensor.
+    Returns (n_items, alpha) arrays of shape (R, R).
+    """
+    X = np.ascontiguousarray(X, dtype=float)
+    valid = ~np.isnan(X)
+    cats = np.unique(X[valid])
+    try:  # imported here so loading this module doesn't pull in numba (~0.3 s)
+        from _alpha_numba import pair_sums
+    except ImportError:  # numba not installed: NumPy path below
+        pair_sums = None
+    if pair_sums is not None:
+        n, agree, share = pair_sums(X, cats)
+    else:
+        M = (X[:, :, None] == cats[None, None, :]).astype(float)
+        B = valid.astype(float)
+        n = B.T @ B
+        agree = np.einsum("iac,ibc->ab", M, M, optimize=True)
+        share = np.einsum("iac,ib->cab", M, B, optimize=True)  # [c,a,b]: a said c on items b also rated
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = (share + share.transpose(0, 2, 1)) / (2 * n)
+        De = 1.0 - np.sum(np.square(p), axis=0)
+        Do = 1.0 - agree / n
+        alpha = 1.0 - Do / De
+    alpha = np.where(De == 0, np.where(Do == 0, 1.0, np.nan), alpha)
+    return n, alpha
+
+def build_parser(prog=None):
+    ap = argparse.ArgumentParser(prog=prog, description="Pairwise (head-to-head) Krippendorff's alpha between raters")
+    ap.add_argument("--in_csv", default=r"annotated data sets\annotation_causal.csv")
+    ap.add_argument("--out_csv", default=r"outputs\h2h_pairs.csv")
+    return ap
+
+def run(args):
+    df = pd.read_csv(args.in_csv)
     raters = [c for c in df.columns if c!="Sentence"]
     # normalize to floats with NaN for blanks
     df[raters] = df[raters].replace({"":np.nan,"nan":np.nan}).astype(float)
+    n_ab, alpha_ab = pairwise_alpha_nominal(df[raters].values)
     rows=[]
-    for a,b in combinations(raters,2):
-        sub = df[[a,b]].dropna()
-        if len(sub)>=2:
-            alpha = kripp_alpha_nominal(sub.values)
-            rows.append((a,b,len(sub),alpha))
+    for (i,a),(j,b) in combinations(enumerate(raters),2):
+        if n_ab[i,j]>=2:
+            rows.append((a,b,int(n_ab[i,j]),alpha_ab[i,j]))
     if not rows:
         print("No overlapping rater pairs with >=2 items.")
         return
     out = pd.DataFrame(rows, columns=["rater_a","rater_b","n_items","alpha"]).sort_values("alpha", ascending=False)
-    out.to_csv(r"outputs\h2h_pairs.csv", index=False)
+    out.to_csv(args.out_csv, index=False)
     print("Pairs:", len(out))
     print("Mean α:", out["alpha"].mean())
     print("Median α:", out["alpha"].median())
     print(out.head(10).to_string(index=False))
 
+def main(argv=None):
+    run(build_parser().parse_args(argv))
+
 if __name__=="__main__":
     main()
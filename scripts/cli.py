@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+"""
+Single entry point for the CiRA scripts, so CI / iterative use spawns one process.
+
+Usage:
+  python scripts/cli.py h2h [--in_csv ...] [--out_csv ...]
+  python scripts/cli.py label-openai --in_csv ... --out_csv ...
+  python scripts/cli.py label-responses --in_csv ... --out_csv ...
+  python scripts/cli.py make-sentences [--src ...] [--out ...]
+  python scripts/cli.py score --pred_csv ...
+  python scripts/cli.py cache-overall [--src ...]
+
+Each subcommand's options are those of the underlying script (see `<command> -h`).
+A script is only imported when its subcommand runs, so e.g. `score` never loads
+the OpenAI SDK. In a notebook, import `run` from the script module instead.
+"""
+import argparse, importlib
+
+COMMANDS = {
+    "h2h":             ("analyze_h2h",                "Pairwise Krippendorff's alpha between raters"),
+    "label-openai":    ("llm_label_causal_openai",    "Label sentences via Chat Completions"),
+    "label-responses": ("llm_label_causal_responses", "Label sentences via the Responses API"),
+    "make-sentences":  ("make_sentences_only",        "Extract overall.csv sentences as a text CSV"),
+    "score":           ("score_llm_vs_gold",          "Score predictions against the gold labels"),
+    "cache-overall":   ("_cache_overall",             "Write a Parquet copy of overall.csv"),
+}
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="cli.py", description="CiRA scripts")
+    sub = ap.add_subparsers(dest="command", required=True, metavar="command")
+    for name, (_, help) in COMMANDS.items():
+        sub.add_parser(name, help=help, add_help=False)  # options are parsed by the script itself
+    ns, rest = ap.parse_known_args(argv)
+    module = importlib.import_module(COMMANDS[ns.command][0])
+    parser = module.build_parser(prog=f"cli.py {ns.command}")
+    return module.run(parser.parse_args(rest))
+
+if __name__ == "__main__":
+    main()
@@ -4,23 +4,38 @@ LLM causal labeling for CiRA sentences (OpenAI API).
 
 - Reads CSV with column "text"
 - Calls model set via OPENAI_MODEL (default: gpt-4o). Falls back to gpt-4o-mini if needed.
-- Returns JSON only: {"label": 0/1, "confidence": 0..1}
-- Writes CSV: text,model_label,confidence
+- Sends --batch_size sentences per request; model returns JSON only:
+  {"results": [{"id": n, "label": 0/1, "confidence": 0..1}, ...]}
+- Writes CSV: text,model_label,confidence -- row by row as results arrive, so an
+  interrupted run keeps its progress; --resume picks up where it stopped
 - On API error: prints a clear message and SKIPS the row (no fake zeros).
+- Requests run concurrently (one AsyncOpenAI client), bounded by --concurrency and paced under --rpm/--tpm.
+- --batch submits everything to the Batch API instead (50% cheaper, finishes within 24h).
+- Obvious cases skip the model: an explicit causal marker -> 1 (0.9), a short
+  sentence without one -> 0 (0.7). Disable with --no_shortcircuit.
+- Duplicate sentences are sent once; every copy gets the same label.
+- Labels are cached on disk (--cache_path); reruns only call the API for new sentences.
 
 Usage:
   $env:OPENAI_API_KEY="sk-..."
   $env:OPENAI_MODEL="gpt-4o"   # or gpt-4o-mini
-  python scripts/llm_label_causal_openai.py --in_csv "outputs/sentences_only.csv" --out_csv "outputs/predictions_20.csv" --limit 20 --sleep 0
+  python scripts/llm_label_causal_openai.py --in_csv "outputs/sentences_only.csv" --out_csv "outputs/predictions_20.csv" --limit 20 --concurrency 20
 """
-import os, time, json, argparse, sys, requests
+import os, re, csv, argparse, sys, asyncio, itertools, openai, orjson
+from collections import Counter
+from _rate_limit import TokenBucket, estimate_tokens, parse_retry_after
+from _dedup import Dedup
+from _llm_cache import LLMCache, make_key, DEFAULT_PATH as DEFAULT_CACHE_PATH
 
-API_URL = "https://api.openai.com/v1/chat/completions"
 DEFAULT_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o")  # stronger default
 
-SYSTEM_PROMPT = """You are a careful annotator for *causal relations* in one sentence.
+# explicit causal cues: sentences containing one are labeled 1 without asking the model
+CAUSAL_MARKERS = re.compile(r"\b(because|due to|results in|leads to|causes|caused by|therefore|hence|as a result)\b", re.I)
+SHORT_WORDS = 6  # marker-free sentences shorter than this are labeled 0
 
-Goal: return ONLY JSON: {"label": 0 or 1, "confidence": number 0..1}
+SYSTEM_PROMPT = """You are a careful annotator for *causal relations* in numbered sentences; judge each sentence on its own.
+
+Goal: return ONLY JSON: {"results": [{"id": sentence number, "label": 0 or 1, "confidence": number 0..1}, ...]}, one entry per sentence, in order.
 
 Labeling rule (binary):
 - label=1 if the sentence states or clearly implies that X causes/leads to/makes Y happen (explicit markers like because, due to, leads to, causes, results in; or clear implied cause→effect).
@@ -30,100 +45,333 @@ IMPORTANT:
 - Do NOT default to 0. In typical software/requirements text, **25–40%** of sentences are causal.
 - If causal cues or a clear mechanism are present, choose 1.
 
-Examples (POSITIVE):
-- "This change caused a crash." -> {"label":1, "confidence":0.95}
-- "Due to a race condition, requests time out under load." -> {"label":1, "confidence":0.9}
-- "If the token is missing, the API rejects the request." -> {"label":1, "confidence":0.8}
-- "Increasing the batch size leads to higher memory usage." -> {"label":1, "confidence":0.85}
+Examples (POSITIVE), as the entry for sentence n:
+- "This change caused a crash." -> {"id":n, "label":1, "confidence":0.95}
+- "Due to a race condition, requests time out under load." -> {"id":n, "label":1, "confidence":0.9}
+- "If the token is missing, the API rejects the request." -> {"id":n, "label":1, "confidence":0.8}
+- "Increasing the batch size leads to higher memory usage." -> {"id":n, "label":1, "confidence":0.85}
+
+Examples (NEGATIVE), as the entry for sentence n:
+- "We updated the documentation." -> {"id":n, "label":0, "confidence":0.95}
+- "Memory usage is high and latency increased." (no cause stated) -> {"id":n, "label":0, "confidence":0.7}
+- "After deployment, we saw errors." (temporal only) -> {"id":n, "label":0, "confidence":0.6}
 
-Examples (NEGATIVE):
-- "We updated the documentation." -> {"label":0, "confidence":0.95}
-- "Memory usage is high and latency increased." (no cause stated) -> {"label":0, "confidence":0.7}
-- "After deployment, we saw errors." (temporal only) -> {"label":0, "confidence":0.6}
+Full reply for the input:
+1. "This change caused a crash."
+2. "We updated the documentation."
+-> {"results": [{"id":1, "label":1, "confidence":0.95}, {"id":2, "label":0, "confidence":0.95}]}
 """
 
 
-USER_TEMPLATE = 'Sentence: "{text}"\nReturn JSON only.'
-
-def call_openai(api_key, model, text, temperature=0.2, max_retries=3):
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    payload = {
-        "model": model,
-        "messages": [
-            {"role":"system","content": SYSTEM_PROMPT},
-            {"role":"user","content": USER_TEMPLATE.format(text=text.replace('"','\\"'))}
-        ],
-        "temperature": temperature,
-        "response_format": {"type": "json_object"}
-    }
-    last_status = None
-    last_body = ""
-    for attempt in range(max_retries):
-        r = requests.post(API_URL, headers=headers, json=payload, timeout=60)
-        last_status = r.status_code
-        last_body = r.text[:300]
-        if r.status_code == 200:
-            data = r.json()
+USER_TEMPLATE = (
+    'Sentences:\n{sentences}\n'
+    'Label each sentence independently. Return JSON only: '
+    '{{"results": [{{"id": int, "label": 0 or 1, "confidence": number 0..1}}, ...]}}, one per input, in order.'
+)
+
+def format_sentences(texts):
+    quoted = (t.replace('"', '\\"') for t in texts)
+    return "\n".join(f'{k}. "{t}"' for k, t in enumerate(quoted, 1))
+
+# what parse_batch raises on a malformed reply
+PARSE_ERRORS = (ValueError, TypeError, KeyError, AttributeError)
+
+def parse_batch(content, n):
+    """
+    Parses the model's {"results": [...]} reply into n (label, conf) pairs, in
+    input order. For n == 1 a bare {"label", "confidence"} object is accepted too.
+    """
+    obj = orjson.loads(content)
+    if n == 1 and isinstance(obj, dict) and "results" not in obj and "label" in obj:
+        obj = [obj]
+    items = obj.get("results") if isinstance(obj, dict) else obj
+    if not isinstance(items, list) or len(items) != n:
+        raise ValueError(f"expected {n} results, got {len(items) if isinstance(items, list) else 'none'}")
+    out = [None] * n
+    for k, item in enumerate(items):
+        idx = int(item.get("id", k + 1)) - 1
+        if not 0 <= idx < n:
+            raise ValueError(f"result id {idx + 1} outside 1..{n}")
+        label = 1 if int(item.get("label")) == 1 else 0
+        conf = min(max(float(item.get("confidence", 0.5)), 0.0), 1.0)
+        out[idx] = (label, conf)
+    if any(o is None for o in out):
+        raise ValueError("duplicate or missing ids in results")
+    return out
+
+def build_messages(texts):
+    return [
+        {"role":"system","content": SYSTEM_PROMPT},
+        {"role":"user","content": USER_TEMPLATE.format(sentences=format_sentences(texts))}
+    ]
+
+def cached_labels(cache, model, texts, temperature):
+    """Returns (results with cache hits filled in, None elsewhere; cache keys or None)."""
+    results = [None] * len(texts)
+    if cache is None:
+        return results, None
+    keys = [make_key(model, SYSTEM_PROMPT + USER_TEMPLATE, t, temperature) for t in texts]
+    for k, key in enumerate(keys):
+        hit = cache.get(key)
+        if hit is not None:
+            results[k] = (hit["label"], hit["confidence"])
+    return results, keys
+
+async def call_openai(client, model, texts, temperature=0.2, limiter=None, cache=None):
+    """Labels a batch of sentences with one request. Returns [(label, conf)] aligned with `texts`."""
+    results, keys = cached_labels(cache, model, texts, temperature)
+    todo = [k for k, r in enumerate(results) if r is None]
+    if not todo:
+        return results
+
+    messages = build_messages([texts[k] for k in todo])
+    tokens = estimate_tokens(SYSTEM_PROMPT + messages[1]["content"]) + 20 * (len(todo) - 1)
+    if limiter is not None:
+        await limiter.wait(tokens)
+    try:
+        # the SDK retries 429/5xx itself, honouring Retry-After
+        resp = await client.chat.completions.create(
+            model=model, messages=messages, temperature=temperature,
+            response_format={"type": "json_object"},
+        )
+    except openai.RateLimitError as e:
+        # still limited after the SDK's retries: hold every other worker off as well
+        if limiter is not None:
+            limiter.drain(parse_retry_after(e.response.headers, 1.0))
+        raise
+    labels = parse_batch(resp.choices[0].message.content, len(todo))
+    for k, (label, conf) in zip(todo, labels):
+        results[k] = (label, conf)
+        if cache is not None:
+            cache.set(keys[k], {"label": label, "confidence": conf})
+    return results
+
+async def label_all(client, model, texts, concurrency=20, limiter=None, sleep=0.0, cache=None, batch_size=10,
+                    on_result=None):
+    """
+    Labels all texts concurrently, `batch_size` sentences per request; at most
+    `concurrency` requests are in flight, paced by `limiter` if given. A batch
+    whose reply can't be parsed is retried one sentence at a time so a single bad
+    row can't sink its neighbours; any other error is reported for every row.
+    on_result(k, res) is called as soon as texts[k] is done.
+    Returns a list aligned with `texts`: (label, conf) or the exception raised for that row.
+    """
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(batch):
+        async with sem:
             try:
-                content = data["choices"][0]["message"]["content"]
-                obj = json.loads(content)
-                label = int(obj.get("label"))
-                conf = float(obj.get("confidence", 0.5))
-                label = 1 if label == 1 else 0
-                conf = min(max(conf, 0.0), 1.0)
-                return label, conf
-            except Exception as e:
-                # bad JSON or shape, retry
-                pass
-        time.sleep(1.0 * (attempt + 1))
-    raise RuntimeError(f"OpenAI call failed. status={last_status} body={last_body}")
-
-def main():
-    ap = argparse.ArgumentParser()
+                return await call_openai(client, model, batch, limiter=limiter, cache=cache)
+            finally:
+                if sleep > 0:
+                    await asyncio.sleep(sleep)
+
+    async def run_batch(start, batch):
+        try:
+            out = await bounded(batch)
+        except PARSE_ERRORS as e:
+            if len(batch) == 1:
+                out = [e]
+            else:
+                singles = await asyncio.gather(*(bounded([t]) for t in batch), return_exceptions=True)
+                out = [r if isinstance(r, Exception) else r[0] for r in singles]
+        except Exception as e:  # API/network error: retrying row by row would only multiply it
+            out = [e] * len(batch)
+        if on_result is not None:
+            for k, res in enumerate(out, start):
+                on_result(k, res)
+        return out
+
+    batch_size = max(1, batch_size)
+    tasks = [run_batch(k, texts[k:k + batch_size]) for k in range(0, len(texts), batch_size)]
+    per_batch = await asyncio.gather(*tasks)
+    return [r for out in per_batch for r in out]
+
+BATCH_DONE = ("completed", "failed", "expired", "cancelled")
+
+async def label_batch_api(client, model, texts, temperature=0.2, cache=None, poll_every=30.0):
+    """
+    Labels texts through the Batch API (half price, results within 24h): one
+    /v1/chat/completions request per sentence in an uploaded JSONL, polled until
+    the batch finishes. Returns the same per-text list as label_all.
+    """
+    results, keys = cached_labels(cache, model, texts, temperature)
+    todo = [k for k, r in enumerate(results) if r is None]
+    if not todo:
+        return results
+    lines = [orjson.dumps({
+        "custom_id": f"row-{k}", "method": "POST", "url": "/v1/chat/completions",
+        "body": {"model": model, "messages": build_messages([texts[k]]), "temperature": temperature,
+                 "response_format": {"type": "json_object"}},
+    }) for k in todo]
+
+    upload = await client.files.create(file=("batch_input.jsonl", b"\n".join(lines)), purpose="batch")
+    batch = await client.batches.create(input_file_id=upload.id, endpoint="/v1/chat/completions",
+                                        completion_window="24h")
+    print(f"Submitted batch {batch.id} with {len(todo)} requests.")
+    while batch.status not in BATCH_DONE:
+        await asyncio.sleep(poll_every)
+        batch = await client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        print(f"Batch {batch.id}: {batch.status}" + (f" ({counts.completed}/{counts.total})" if counts else ""))
+    # expired/cancelled batches may still carry partial output; failed requests land in the error file
+    output = ""
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if file_id:
+            output += (await client.files.content(file_id)).text + "\n"
+
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        obj = orjson.loads(line)
+        k = int(obj["custom_id"].split("-", 1)[1])
+        resp = obj.get("response") or {}
+        try:
+            if resp.get("status_code") != 200:
+                err = (resp.get("body") or {}).get("error") or obj.get("error") or {}
+                raise RuntimeError(f"status={resp.get('status_code')} error={err.get('message', err)}")
+            (label, conf), = parse_batch(resp["body"]["choices"][0]["message"]["content"], 1)
+        except Exception as e:
+            results[k] = e
+            continue
+        results[k] = (label, conf)
+        if cache is not None:
+            cache.set(keys[k], {"label": label, "confidence": conf})
+    for k in todo:
+        if results[k] is None:
+            results[k] = RuntimeError(f"no result in batch {batch.id} (status={batch.status})")
+    return results
+
+def iter_chunks(reader, limit=0, skip=(), size=1000):
+    """
+    Turns csv.DictReader rows into lists of (row number, text), `size` rows at a
+    time, minus blanks and, per text, the first skip[text] copies (rows already in out_csv).
+    """
+    skip = Counter(skip)
+    rows = itertools.islice(enumerate(reader), limit if limit > 0 else None)
+    while chunk := list(itertools.islice(rows, size)):
+        out = []
+        for i, r in chunk:
+            t = (r["text"] or "").strip()
+            if not t:
+                continue
+            if skip[t] > 0:
+                skip[t] -= 1
+                continue
+            out.append((i, t))
+        yield out
+
+def short_circuit(chunks, emit):
+    """Labels the obvious cases locally -- (1, 0.9) for an explicit causal marker,
+    (0, 0.7) for a short sentence without one -- and yields only the rest for the model."""
+    for rows in chunks:
+        rest = []
+        for row in rows:
+            text = row[1]
+            if CAUSAL_MARKERS.search(text):
+                emit(row, (1, 0.9))
+            elif len(text.split()) < SHORT_WORDS:
+                emit(row, (0, 0.7))
+            else:
+                rest.append(row)
+        yield rest
+
+async def label_stream(api_key, args, chunks, cache, emit):
+    limiter = TokenBucket(args.rpm, args.tpm)
+    # one client (and so one keep-alive connection pool) for the whole run
+    async with openai.AsyncOpenAI(api_key=api_key, max_retries=5, timeout=60.0) as client:
+        if args.batch:
+            rows = [r for chunk in chunks for r in chunk]
+            results = await label_batch_api(client, args.model, [t for _, t in rows], cache=cache,
+                                            poll_every=args.poll_every)
+            for row, res in zip(rows, results):
+                emit(row, res)
+            return
+        for rows in chunks:
+            await label_all(client, args.model, [t for _, t in rows], concurrency=args.concurrency,
+                            limiter=limiter, sleep=args.sleep, cache=cache, batch_size=args.batch_size,
+                            on_result=lambda k, res, rows=rows: emit(rows[k], res))
+
+def build_parser(prog=None):
+    ap = argparse.ArgumentParser(prog=prog)
     ap.add_argument("--in_csv", required=True, help='Path to CSV with "text" column')
     ap.add_argument("--out_csv", required=True, help="Where to write predictions.csv")
     ap.add_argument("--limit", type=int, default=0, help="Only label first N rows")
     ap.add_argument("--model", default=DEFAULT_MODEL, help="Model name (default from OPENAI_MODEL or gpt-4o)")
-    ap.add_argument("--sleep", type=float, default=0.0, help="Seconds to sleep between calls")
-    args = ap.parse_args()
+    ap.add_argument("--sleep", type=float, default=0.0, help="Seconds each worker sleeps after a call")
+    ap.add_argument("--concurrency", type=int, default=20, help="Max requests in flight")
+    ap.add_argument("--batch_size", type=int, default=10, help="Sentences sent per request")
+    ap.add_argument("--rpm", "--qpm", type=int, default=0, help="Requests-per-minute budget (0 = unlimited)")
+    ap.add_argument("--tpm", type=int, default=0, help="Estimated tokens-per-minute budget (0 = unlimited)")
+    ap.add_argument("--batch", action="store_true", help="Use the Batch API (50%% cheaper, asynchronous, up to 24h)")
+    ap.add_argument("--poll_every", type=float, default=30.0, help="Seconds between Batch API status checks")
+    ap.add_argument("--no_shortcircuit", action="store_true",
+                    help="Send every sentence to the model (no marker/length shortcut); use for evaluation runs")
+    ap.add_argument("--resume", action="store_true", help="Append to an existing out_csv, skipping the input rows already in it")
+    ap.add_argument("--cache_path", default=DEFAULT_CACHE_PATH, help="SQLite file caching labels across runs")
+    ap.add_argument("--no_cache", action="store_true", help="Always call the API; don't read or write the cache")
+    return ap
 
+def run(args):
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
         sys.exit("ERROR: Set OPENAI_API_KEY environment variable in this terminal/session.")
-    try:
-        import pandas as pd
-    except ImportError:
-        sys.exit("Missing pandas: run 'python -m pip install pandas requests'")
+    out_path = args.out_csv
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+
+    # --resume: keep what's already in out_csv and only label the rest
+    done = Counter()  # text -> rows already in out_csv; later copies of a text are still labeled
+    if args.resume and os.path.exists(out_path):
+        with open(out_path, newline="", encoding="utf-8") as f:
+            done = Counter(r["text"] for r in csv.DictReader(f))
+        print(f"Resuming: {sum(done.values())} rows ({len(done)} sentences) already in {out_path}")
 
-    df = pd.read_csv(args.in_csv)
-    if "text" not in df.columns:
+    src = open(args.in_csv, newline="", encoding="utf-8-sig")
+    reader = csv.DictReader(src)
+    if "text" not in (reader.fieldnames or []):
         sys.exit('Input must have a "text" column.')
 
-    if args.limit and args.limit > 0:
-        df = df.head(args.limit)
+    cache = None if args.no_cache else LLMCache(args.cache_path)
+    written = 0
+    with src, open(out_path, "a" if done else "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["text", "model_label", "confidence"])
+        if not done:
+            writer.writeheader()
 
-    out_path = args.out_csv
-    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        def emit(row, res):
+            nonlocal written
+            i, text = row
+            if isinstance(res, Exception):
+                print(f"API error on row {i}: {res}")
+                return
+            label, conf = res
+            writer.writerow({"text": text, "model_label": label, "confidence": conf})
+            f.flush()  # a crash or Ctrl-C keeps everything labeled so far
+            written += 1
+            if written % 20 == 0:
+                print(f"Labeled {written} sentences...")
 
-    out_rows = []
-    for i, row in df.iterrows():
-        text = str(row["text"]).strip()
-        if not text:
-            continue
+        dedup = Dedup(emit)
+        chunks = dedup.filter(iter_chunks(reader, args.limit, skip=done))
+        shortcut = 0
+        if not args.no_shortcircuit:
+            def decided(row, res):
+                nonlocal shortcut
+                shortcut += 1
+                dedup.done(row, res)
+            chunks = short_circuit(chunks, decided)
         try:
-            label, conf = call_openai(api_key, args.model, text)
-        except Exception as e:
-            print(f"API error on row {i}: {e}")
-            continue
-        out_rows.append({"text": text, "model_label": label, "confidence": conf})
-        if args.sleep > 0:
-            time.sleep(args.sleep)
-        if (i + 1) % 20 == 0:
-            print(f"Labeled {i+1} sentences...")
-
-    import pandas as pd
-    pd.DataFrame(out_rows).to_csv(out_path, index=False)
-    print(f"Wrote {out_path} with {len(out_rows)} rows.")
+            asyncio.run(label_stream(api_key, args, chunks, cache, dedup.done))
+        finally:
+            if cache is not None:
+                cache.close()
+    print(f"Skipped {dedup.avoided} API calls for duplicate sentences.")
+    if shortcut:
+        print(f"Labeled {shortcut} sentences by marker/length rule without the API.")
+    print(f"Wrote {out_path} with {sum(done.values()) + written} rows.")
+
+def main(argv=None):
+    run(build_parser().parse_args(argv))
 
 if __name__ == "__main__":
     main()
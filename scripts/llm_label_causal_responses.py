@@ -1,94 +1,115 @@
-import os, json, time, argparse, sys, requests, pandas as pd
+import os, csv, argparse, sys, asyncio, openai, orjson, pandas as pd
+from collections import Counter
+from _rate_limit import TokenBucket, estimate_tokens, parse_retry_after
+from _dedup import Dedup
+from _llm_cache import LLMCache, make_key, DEFAULT_PATH as DEFAULT_CACHE_PATH
 
-API_URL = "https://api.openai.com/v1/responses"
 MODEL   = os.environ.get("OPENAI_MODEL", "gpt-5-nano")   # works with your test key
 
 SYSTEM_PROMPT = """You are a careful annotator for causal relations in one sentence.
 Return ONLY JSON: {"label": 0 or 1, "confidence": 0..1}
 Label 1 if the sentence clearly states/implies cause→effect (because, due to, results in, leads to, if X then Y, etc.). Else 0.
 Do NOT default to 0; in similar corpora 25–40% are causal."""
+USER_TEMPLATE = '\n\nSentence: "{text}"\nReturn JSON only.'
 
-def parse_output(data: dict) -> str:
-    """
-    Responses API can return text in a few shapes; this tries them in order.
-    Returns the JSON string we asked the model to produce.
-    """
-    # 1) direct convenience field (when present)
-    if "output_text" in data and data["output_text"]:
-        return data["output_text"]
-    # 2) output.text (newer shape)
+async def call_responses(client, model, text, limiter=None, cache=None):
+    if cache is not None:
+        key = make_key(model, SYSTEM_PROMPT + USER_TEMPLATE, text, None)  # no temperature sent; model default
+        hit = cache.get(key)
+        if hit is not None: return hit["label"], hit["confidence"]
+    prompt = SYSTEM_PROMPT + USER_TEMPLATE.format(text=text.replace('"', '\\"'))
+    if limiter is not None: await limiter.wait(estimate_tokens(prompt))
     try:
-        ot = data.get("output", {})
-        if isinstance(ot, dict) and "text" in ot and ot["text"]:
-            return ot["text"]
-    except: pass
-    # 3) output.choices[0].message.content[0].text (older-like shape)
-    try:
-        choices = data.get("output", {}).get("choices", [])
-        if choices:
-            content = choices[0]["message"]["content"]
-            if content and isinstance(content, list) and "text" in content[0]:
-                return content[0]["text"]
-    except: pass
-    # 4) output (array of objects) → look for a message with content[].text
-    try:
-        out = data.get("output", [])
-        for item in out:
-            if item.get("type") == "message":
-                content = item.get("content", [])
-                for chunk in content:
-                    if "text" in chunk:
-                        return chunk["text"]
-    except: pass
-    raise ValueError("Could not find output text in response payload")
+        r = await client.responses.create(model=model, input=prompt)  # SDK retries 429/5xx itself
+    except openai.RateLimitError as e:
+        if limiter is not None: limiter.drain(parse_retry_after(e.response.headers, 1.0))
+        raise
+    obj = orjson.loads(r.output_text)
+    y  = 1 if int(obj.get("label", 0)) == 1 else 0
+    p  = max(0.0, min(1.0, float(obj.get("confidence", 0.5))))
+    if cache is not None: cache.set(key, {"label": y, "confidence": p})
+    return y, p
 
-def call_responses(api_key, model, text, retries=3):
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type":"application/json"}
-    payload = {
-        "model": model,
-        "input": f"{SYSTEM_PROMPT}\n\nSentence: \"{text.replace('\"','\\\"')}\"\nReturn JSON only.",
-    }
-    last = ""
-    for a in range(retries):
-        r = requests.post(API_URL, headers=headers, json=payload, timeout=60)
-        last = r.text[:400]
-        if r.status_code == 200:
-            content = parse_output(r.json())
-            obj = json.loads(content)
-            y  = 1 if int(obj.get("label", 0)) == 1 else 0
-            p  = float(obj.get("confidence", 0.5))
-            return y, max(0.0, min(1.0, p))
-        time.sleep(1.0*(a+1))
-    raise RuntimeError(f"Responses API failed: {last}")
+async def label_all(key, model, chunks, emit, concurrency=20, rpm=0, tpm=0, sleep=0.0, cache=None):
+    """Labels each chunk of (row, text) concurrently (at most `concurrency` in flight);
+    emit((row, text), (y, p) or exception) is called as each one finishes."""
+    sem = asyncio.Semaphore(max(1, concurrency))
+    limiter = TokenBucket(rpm, tpm)
+    async def bounded(i, t):
+        async with sem:
+            try: r = await call_responses(client, model, t, limiter=limiter, cache=cache)
+            except Exception as e: r = e
+            emit((i, t), r)
+            if sleep > 0: await asyncio.sleep(sleep)
+    async with openai.AsyncOpenAI(api_key=key, max_retries=5, timeout=60.0) as client:
+        for rows in chunks:
+            await asyncio.gather(*(bounded(i, t) for i, t in rows))
 
-def main():
-    ap = argparse.ArgumentParser()
+def iter_chunks(reader, skip=()):
+    # strip/blank-filter each chunk in one vectorized pass; no per-row Series like iterrows()
+    # skip[text] copies of each text are already in out_csv; later copies still go through
+    skip = Counter(skip)
+    for chunk in reader:
+        t = chunk["text"].str.strip()  # read as str with no NA parsing: only empty cells are blank
+        t = t[t != ""]
+        out = []
+        for i, x in zip(t.index.tolist(), t.to_numpy().tolist()):
+            if skip[x] > 0: skip[x] -= 1
+            else: out.append((i, x))
+        yield out
+
+def build_parser(prog=None):
+    ap = argparse.ArgumentParser(prog=prog)
     ap.add_argument("--in_csv", required=True)
     ap.add_argument("--out_csv", required=True)
     ap.add_argument("--limit", type=int, default=0)
     ap.add_argument("--sleep", type=float, default=0.0)
-    args = ap.parse_args()
+    ap.add_argument("--concurrency", type=int, default=20, help="Max requests in flight")
+    ap.add_argument("--rpm", type=int, default=0, help="Requests-per-minute budget (0 = unlimited)")
+    ap.add_argument("--tpm", type=int, default=0, help="Estimated tokens-per-minute budget (0 = unlimited)")
+    ap.add_argument("--resume", action="store_true", help="Append to an existing out_csv, skipping the input rows already in it")
+    ap.add_argument("--cache_path", default=DEFAULT_CACHE_PATH, help="SQLite file caching labels across runs")
+    ap.add_argument("--no_cache", action="store_true", help="Always call the API; don't read or write the cache")
+    return ap
 
+def run(args):
     key = os.environ.get("OPENAI_API_KEY")
     if not key: sys.exit("Set OPENAI_API_KEY")
-    df = pd.read_csv(args.in_csv)
-    if "text" not in df.columns: sys.exit('Input must have "text" column')
-    if args.limit > 0: df = df.head(args.limit)
+    if "text" not in pd.read_csv(args.in_csv, nrows=0).columns: sys.exit('Input must have "text" column')
 
-    out = []
-    for i, row in df.iterrows():
-        t = str(row["text"]).strip()
-        if not t: continue
+    done = Counter()  # text -> rows already in out_csv
+    if args.resume and os.path.exists(args.out_csv):
+        with open(args.out_csv, newline="", encoding="utf-8") as f: done = Counter(r["text"] for r in csv.DictReader(f))
+        print(f"Resuming: {sum(done.values())} rows ({len(done)} sentences) already in {args.out_csv}")
+    cache = None if args.no_cache else LLMCache(args.cache_path)
+    n = 0
+    with open(args.out_csv, "a" if done else "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=["text", "model_label", "confidence"])
+        if not done: w.writeheader()
+        def emit(row, r):
+            nonlocal n
+            i, t = row
+            if isinstance(r, Exception):
+                print("API error on row", i, "->", r)
+                return
+            w.writerow({"text": t, "model_label": r[0], "confidence": r[1]})
+            f.flush()  # progress survives a crash or Ctrl-C
+            n += 1
+            if n % 20 == 0: print(f"Labeled {n} sentences...")
+        reader = pd.read_csv(args.in_csv, usecols=["text"], dtype={"text": str}, keep_default_na=False,
+                             chunksize=1000, nrows=args.limit if args.limit > 0 else None)
+        dedup = Dedup(emit)
         try:
-            y, p = call_responses(key, MODEL, t)
-            out.append({"text": t, "model_label": y, "confidence": p})
-        except Exception as e:
-            print("API error on row", i, "->", e)
-            continue
-        if args.sleep > 0: time.sleep(args.sleep)
-        if (i+1) % 20 == 0: print(f"Labeled {i+1} sentences...")
-    pd.DataFrame(out).to_csv(args.out_csv, index=False)
-    print(f"Wrote {args.out_csv} with {len(out)} rows.")
+            asyncio.run(label_all(key, MODEL, dedup.filter(iter_chunks(reader, skip=done)), dedup.done,
+                                  concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm, sleep=args.sleep,
+                                  cache=cache))
+        finally:
+            if cache is not None: cache.close()
+    print(f"Skipped {dedup.avoided} API calls for duplicate sentences.")
+    print(f"Wrote {args.out_csv} with {sum(done.values()) + n} rows.")
+
+def main(argv=None):
+    run(build_parser().parse_args(argv))
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,30 @@
-import pandas as pd, os
-src = r"annotated data sets\overall.csv"   # note the space in the folder name
-df = pd.read_csv(src)
-out = r"outputs\sentences_only.csv"
-df[["Sentence"]].rename(columns={"Sentence":"text"}).to_csv(out, index=False)
-print(f"Wrote {out} with", len(df), "rows")
+import argparse, pandas as pd, os
+from _cache_overall import fresh_parquet
+
+def build_parser(prog=None):
+    ap = argparse.ArgumentParser(prog=prog, description='Extract the Sentence column of overall.csv as a "text" CSV')
+    ap.add_argument("--src", default=r"annotated data sets\overall.csv")   # note the space in the folder name
+    ap.add_argument("--out", default=r"outputs\sentences_only.csv")
+    return ap
+
+def run(args):
+    pq = fresh_parquet(args.src, ["Sentence"])
+    if pq is not None:  # columnar copy from _cache_overall.py: read just the one column
+        df = pd.read_parquet(pq, columns=["Sentence"])
+        df.rename(columns={"Sentence":"text"}).to_csv(args.out, index=False)
+        print(f"Wrote {args.out} with", len(df), "rows")
+        return
+    # only the Sentence column is parsed, and rows are streamed in chunks so memory stays flat
+    n = 0
+    for i, chunk in enumerate(pd.read_csv(args.src, usecols=["Sentence"], dtype={"Sentence": "string"}, chunksize=100_000)):
+        chunk.rename(columns={"Sentence":"text"}).to_csv(args.out, mode="w" if i==0 else "a", header=i==0, index=False)
+        n += len(chunk)
+    if n == 0:
+        pd.DataFrame(columns=["text"]).to_csv(args.out, index=False)
+    print(f"Wrote {args.out} with", n, "rows")
+
+def main(argv=None):
+    run(build_parser().parse_args(argv))
+
+if __name__ == "__main__":
+    main()
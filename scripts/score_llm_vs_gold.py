@@ -1,45 +1,82 @@
 import argparse, pandas as pd, numpy as np
-from sklearn.metrics import accuracy_score, precision_recall_fscore_support, confusion_matrix
-
-def to01(x):
-    if pd.isna(x): return np.nan
-    if isinstance(x,str):
-        t=x.strip().lower()
-        if t in ("1","true","yes"): return 1
-        if t in ("0","false","no"): return 0
-    try: return int(float(x))
-    except: return np.nan
-
-ap = argparse.ArgumentParser(description="Score LLM predictions vs CiRA gold labels")
-ap.add_argument("--label_col", default="Causal")
-ap.add_argument("--overall_csv", default=r"annotated data sets\overall.csv")
-ap.add_argument("--pred_csv", required=True)
-ap.add_argument("--out_csv", default=r"outputs\merged_llm_gold.csv")
-args = ap.parse_args()
-
-gold = pd.read_csv(args.overall_csv).rename(columns={"Sentence":"text"})
-pred = pd.read_csv(args.pred_csv)
-
-merged = gold[["text", args.label_col]].merge(
-    pred[["text","model_label"] + ([c for c in ["confidence"] if c in pred.columns])],
-    on="text", how="inner"
-)
-merged["y_true"] = merged[args.label_col].apply(to01)
-merged["y_pred"] = merged["model_label"].apply(to01)
-merged = merged.dropna(subset=["y_true","y_pred"])
-
-if len(merged)==0:
-    raise SystemExit("No overlaps. Make sure 'text' matches exactly.")
-
-y_true = merged["y_true"].astype(int).values
-y_pred = merged["y_pred"].astype(int).values
-
-acc = accuracy_score(y_true,y_pred)
-prec,rec,f1,_ = precision_recall_fscore_support(y_true,y_pred,average="binary",zero_division=0)
-tn,fp,fn,tp = confusion_matrix(y_true,y_pred).ravel()
-
-print(f"N={len(merged)} | Accuracy={acc:.3f} Precision={prec:.3f} Recall={rec:.3f} F1={f1:.3f}")
-print(f"Confusion: [[{tn}, {fp}],[{fn}, {tp}]]")
-
-merged.to_csv(args.out_csv, index=False)
-print("Wrote", args.out_csv)
+from _cache_overall import fresh_parquet
+
+BOOL_MAP = {"1":1,"true":1,"yes":1,"0":0,"false":0,"no":0}
+
+def to01(col):
+    """Coerces a label column to 0/1 floats in one vectorized pass; NaN where unparseable."""
+    s = col.astype("string").str.strip().str.lower()
+    coded = s.map(BOOL_MAP).astype(float)
+    numeric = np.trunc(pd.to_numeric(s, errors="coerce").astype(float)).replace([np.inf,-np.inf], np.nan)
+    return coded.fillna(numeric)
+
+def read_narrow(path, dtype, usecols=None):
+    """read_csv (or its fresh Parquet copy) with compact dtypes. If a label column isn't
+    clean integers, it keeps its inferred dtype and to01 sorts it out."""
+    loose = {k: v for k, v in dtype.items() if v == "string"}
+    pq = fresh_parquet(path, usecols)
+    if pq is not None:
+        df = pd.read_parquet(pq, columns=usecols)
+        try:
+            return df.astype({k: v for k, v in dtype.items() if k in df.columns})
+        except (ValueError, TypeError):
+            return df.astype({k: v for k, v in loose.items() if k in df.columns})
+    try:
+        return pd.read_csv(path, dtype=dtype, usecols=usecols)
+    except (ValueError, TypeError):
+        return pd.read_csv(path, dtype=loose, usecols=usecols)
+
+def build_parser(prog=None):
+    ap = argparse.ArgumentParser(prog=prog, description="Score LLM predictions vs CiRA gold labels")
+    ap.add_argument("--label_col", default="Causal")
+    ap.add_argument("--overall_csv", default=r"annotated data sets\overall.csv")
+    ap.add_argument("--pred_csv", required=True)
+    ap.add_argument("--out_csv", default=r"outputs\merged_llm_gold.csv")
+    return ap
+
+def run(args):
+    gold = read_narrow(args.overall_csv, {"Sentence":"string", args.label_col:"Int8"},
+                       usecols=["Sentence", args.label_col]).rename(columns={"Sentence":"text"})
+    pred = read_narrow(args.pred_csv, {"text":"string", "model_label":"Int8", "confidence":"float32"})
+
+    # integer-coded join: pred texts not in gold can't match anyway, the rest share gold's categories
+    gold["text"] = gold["text"].astype("category")
+    pred = pred[pred["text"].isin(gold["text"].cat.categories)].assign(text=lambda d: d["text"].astype(gold["text"].dtype))
+
+    merged = gold[["text", args.label_col]].merge(
+        pred[["text","model_label"] + ([c for c in ["confidence"] if c in pred.columns])],
+        on="text", how="inner"
+    )
+    merged["y_true"] = to01(merged[args.label_col])
+    merged["y_pred"] = to01(merged["model_label"])
+    merged = merged.dropna(subset=["y_true","y_pred"]).astype({"y_true":int,"y_pred":int})
+
+    if len(merged)==0:
+        raise SystemExit("No overlaps. Make sure 'text' matches exactly.")
+
+    y_true = merged["y_true"].values
+    y_pred = merged["y_pred"].values
+
+    if not (np.isin(y_true,(0,1)).all() and np.isin(y_pred,(0,1)).all()):
+        raise SystemExit("Labels must be binary (0/1) after coercion.")
+
+    # binary metrics straight from the 2x2 confusion counts
+    k = np.bincount(2*y_true + y_pred, minlength=4)
+    tn,fp,fn,tp = k.tolist()
+    acc = (tn+tp)/k.sum()
+    prec = tp/(tp+fp) if tp+fp else 0.0
+    rec = tp/(tp+fn) if tp+fn else 0.0
+    f1 = 2*prec*rec/(prec+rec) if prec+rec else 0.0
+
+    print(f"N={len(merged)} | Accuracy={acc:.3f} Precision={prec:.3f} Recall={rec:.3f} F1={f1:.3f}")
+    print(f"Confusion: [[{tn}, {fp}],[{fn}, {tp}]]")
+
+    merged.to_csv(args.out_csv, index=False)
+    print("Wrote", args.out_csv)
+    return {"n": len(merged), "accuracy": acc, "precision": prec, "recall": rec, "f1": f1}
+
+def main(argv=None):
+    run(build_parser().parse_args(argv))
+
+if __name__ == "__main__":
+    main()